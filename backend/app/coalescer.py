@@ -0,0 +1,102 @@
+"""
+Regroupement de requêtes - Accumule les appels concurrents en lots
+"""
+from contextlib import suppress
+from typing import Any, Optional, Set
+import asyncio
+
+
+class Coalescer:
+    """Regroupe les appels concurrents à submit() en lots traités par _process()
+    
+    Avec concurrent=True, chaque lot part dans sa propre tâche: un lot lent
+    (appel réseau) ne bloque pas la collecte des suivants. Sinon un seul lot
+    est en vol à la fois (ressources réutilisées d'un lot à l'autre).
+    """
+    
+    concurrent = False
+    
+    def __init__(self, max_batch: int, max_wait_ms: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+    
+    def start(self) -> None:
+        """Démarre la tâche de fond (à appeler depuis la boucle asyncio)"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Arrête la tâche de fond et les lots en cours"""
+        if self._task is None:
+            return
+        tasks = [self._task, *self._inflight]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+        self._task = None
+        self._inflight.clear()
+    
+    async def submit(self, item: Any) -> Any:
+        """Met un élément en file et attend son résultat"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+    
+    async def _process(self, items: list) -> list:
+        """Traite un lot: un résultat par élément, dans l'ordre"""
+        raise NotImplementedError
+    
+    async def _collect(self) -> list:
+        """Attend un premier élément puis accumule jusqu'à max_batch ou max_wait"""
+        loop = asyncio.get_running_loop()
+        items = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        
+        while len(items) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+    
+    async def _dispatch(self, items: list) -> None:
+        """Traite un lot et résout les futures des appelants"""
+        try:
+            results = await self._process([item for item, _ in items])
+        except asyncio.CancelledError:
+            for _, future in items:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+    
+    async def _run(self) -> None:
+        while True:
+            items = await self._collect()
+            if not self.concurrent:
+                await self._dispatch(items)
+                continue
+            task = asyncio.create_task(self._dispatch(items))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
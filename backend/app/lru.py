@@ -0,0 +1,42 @@
+"""
+Cache LRU - Dictionnaire borné, évince l'entrée la moins récente
+"""
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Any, Hashable, Optional
+import threading
+
+
+class LRUCache:
+    """Cache LRU de taille max fixe (OrderedDict)
+    
+    Avec lock=True, lectures et écritures passent par un verrou (cache partagé
+    entre threads); sans, le cache n'est utilisé que depuis la boucle asyncio.
+    """
+    
+    def __init__(self, maxsize: int, lock: bool = False):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock() if lock else nullcontext()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Lit une valeur en cache (et la marque comme récente)"""
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+    
+    def put(self, key: Hashable, value: Any) -> None:
+        """Ajoute une valeur en évinçant la plus ancienne au-delà de la taille max"""
+        with self._lock:
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
@@ -1,10 +1,11 @@
 """
 EV Energy Prediction API - Point d'entrée
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
+import os
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,8 +13,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+from app.responses import ORJSONResponse, dumps
+
 # Import du loader de modèle
-from app.models.ml_model import load_model, get_model
+from app.models.ml_model import ensure_loaded, get_model, on_model_change, start_batcher, stop_batcher
 
 
 @asynccontextmanager
@@ -23,7 +26,7 @@ async def lifespan(app: FastAPI):
     
     # Charger le modèle ML
     try:
-        model = load_model()
+        model = await ensure_loaded()
         if model:
             logger.info(f"✅ Modèle ML chargé: {type(model).__name__}")
         else:
@@ -32,8 +35,18 @@ async def lifespan(app: FastAPI):
         logger.error(f"❌ Erreur chargement modèle: {e}")
         logger.warning("⚠️ Utilisation du fallback physique")
     
+    # Regroupe les prédictions concurrentes en un seul appel au modèle
+    start_batcher()
+    
+    # Client HTTP partagé pour OpenTopoData, requêtes /single regroupées
+    await elevation.start_client()
+    elevation.start_coalescer()
+    
     yield
     
+    await elevation.stop_coalescer()
+    await elevation.close_client()
+    await stop_batcher()
     logger.info("👋 Arrêt de l'API...")
 
 
@@ -41,14 +54,20 @@ app = FastAPI(
     title="EV Energy Prediction API",
     version="2.0.0",
     description="API de prédiction de consommation énergétique pour véhicules électriques",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
-# CORS - Autoriser toutes les origines pour tests mobile/web
+# CORS - Liste d'origines autorisées (CORS_ORIGINS="https://a.com,https://b.com")
+# "*" par défaut pour les tests mobile/web; les credentials ne sont pas compatibles avec "*"
+CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "*").split(",") if o.strip()]
+CORS_ORIGIN_REGEX = os.getenv("CORS_ORIGIN_REGEX")
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
+    allow_origins=CORS_ORIGINS,
+    allow_origin_regex=CORS_ORIGIN_REGEX,
+    allow_credentials="*" not in CORS_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
 )
@@ -60,11 +79,17 @@ app.include_router(prediction.router)
 app.include_router(elevation.router)
 
 
-@app.get("/")
-async def root():
-    """Informations API"""
+# Corps JSON pré-encodés de / et /health, réencodés à chaque modèle publié
+_ROOT_BYTES = b""
+_APP_HEALTH_BYTES = b""
+
+
+@on_model_change
+def _refresh_app_payloads() -> None:
+    """Encode les réponses de / et /health pour le modèle courant"""
+    global _ROOT_BYTES, _APP_HEALTH_BYTES
     model = get_model()
-    return {
+    _ROOT_BYTES = dumps({
         "name": "EV Energy Prediction API",
         "version": "2.0.0",
         "status": "running",
@@ -72,14 +97,20 @@ async def root():
         "model_type": type(model).__name__ if model else "Physics fallback",
         "docs": "/docs",
         "team": "Team 5314 - ESILV"
-    }
+    })
+    _APP_HEALTH_BYTES = dumps({
+        "status": "healthy",
+        "ml_model_ready": model is not None
+    })
+
+
+@app.get("/")
+async def root():
+    """Informations API"""
+    return Response(content=_ROOT_BYTES, media_type="application/json")
 
 
 @app.get("/health")
 async def health():
     """Health check"""
-    model = get_model()
-    return {
-        "status": "healthy",
-        "ml_model_ready": model is not None
-    }
\ No newline at end of file
+    return Response(content=_APP_HEALTH_BYTES, media_type="application/json")
\ No newline at end of file
@@ -4,13 +4,30 @@ ML Model Loader - Télécharge et charge le modèle XGBoost depuis GitHub Releas
 VERSION SIMPLIFIÉE: XGBoost seul (pas de StackingEnsemble)
 """
 import os
+
+# Un seul thread OpenMP/BLAS par worker: en inférence batch-1 sous requêtes
+# concurrentes, le multi-threading par défaut sur-souscrit les cœurs et fait
+# exploser la latence. Doit être défini avant l'import de numpy/xgboost.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+
 import logging
+import asyncio
+import hashlib
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
 import joblib
 from pathlib import Path
-from typing import Optional, Any
+from typing import Callable, Optional, Any
 import requests
 import numpy as np
 
+from app.coalescer import Coalescer
+from app.lru import LRUCache
+
 # ============================================
 # IMPORT DEPENDENCIES
 # ============================================
@@ -35,7 +52,68 @@ MODEL_URL = os.getenv(
     "https://github.com/serikch/ev-prediction-app/releases/download/v1.0.0/top2_model_bev2_without_battery_features_xgboost.pkl"
 )
 
-_model: Optional[Any] = None
+# SHA-256 du fichier complet (optionnel): un modèle qui ne correspond pas est rejeté
+MODEL_SHA256 = (os.getenv("MODEL_SHA256") or "").lower() or None
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Au démarrage, revalide le modèle présent sur disque via son ETag (If-None-Match):
+# 304 si inchangé, sinon la nouvelle version est téléchargée
+MODEL_REVALIDATE = os.getenv("MODEL_REVALIDATE", "").lower() in ("1", "true", "yes")
+
+# En dessous de cette taille, le modèle est chargé depuis la mémoire sans passer par le disque
+MODEL_INMEMORY_MAX_BYTES = int(os.getenv("MODEL_INMEMORY_MAX_MB", "200")) * 1024 * 1024
+
+
+@dataclass(frozen=True, slots=True)
+class _ModelCtx:
+    """Modèle chargé et tout ce que le chemin chaud en dérive, résolu une seule fois
+
+    Publié d'un bloc (voir _prepare_inference): une prédiction concurrente voit
+    soit l'ancien contexte, soit le nouveau, jamais un mélange des deux.
+    """
+    model: Any
+    predict: Callable[[np.ndarray], np.ndarray]  # bloc (m, n) -> (m,)
+    feats: tuple
+    n: int
+    derived: tuple                               # (colonne, formule)
+    base_cols: tuple                             # colonnes speed_kmh, acceleration, slope
+    key_cols: np.ndarray                         # colonnes de la clé de cache (non dérivées)
+    key_scale: np.ndarray                        # 1 / pas de quantification de ces colonnes
+    info: dict                                   # métadonnées exposées par /api/predict/models
+
+
+_ctx: Optional[_ModelCtx] = None
+
+# Rappelés à chaque publication d'un contexte (voir on_model_change)
+_model_listeners: list = []
+
+# Les modèles à arbres travaillent en float32: un buffer float32 C-contigu est
+# consommé sans copie ni conversion par inplace_predict / ONNX Runtime
+INPUT_DTYPE = np.float32
+
+# Prédictions exécutées hors de la boucle asyncio
+_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="predict")
+_load_lock = threading.Lock()
+
+# Cache LRU des prédictions récentes: les secondes successives d'un trajet
+# produisent des vecteurs quasi identiques. La clé porte sur les features
+# envoyées (les dérivées s'en déduisent), quantifiées par feature: 0.5 km/h
+# pour les vitesses, 0.1 pour le reste (pente en %, accélération...). Les
+# compteurs cumulés (+1 s à chaque tick en roulant) ont des pas grossiers,
+# sans quoi aucune clé ne se répète d'un tick à l'autre
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))
+CACHE_QUANTUM = 0.1
+CACHE_QUANTA = {
+    'speed_kmh': 0.5,
+    'speed_roll_mean_10': 0.5,
+    'speed_roll_max_10': 0.5,
+    'speed_roll_min_10': 0.5,
+    'time_since_stop': 60.0,
+    'cumul_elevation_gain': 10.0,
+    'cumul_elevation_loss': 10.0,
+}
+# Partagé entre la boucle asyncio et les threads du pool d'inférence
+_pred_cache = LRUCache(PREDICTION_CACHE_SIZE, lock=True)
 
 FEATURE_ORDER = [
     'speed_kmh', 'speed2', 'speed3', 'acceleration', 'slope',
@@ -52,32 +130,178 @@ FEATURE_ORDER = [
     'accel_per_speed', 'slope_per_speed',
 ]
 
+# Features dérivées des features de base, recalculées côté serveur (mêmes formules
+# que useFeatureCalculator): le client n'a besoin d'envoyer que les features de base
+DERIVED_FEATURES = {
+    'speed2': lambda s, a, sl: s * s,
+    'speed3': lambda s, a, sl: s * s * s,
+    'slope_abs': lambda s, a, sl: np.abs(sl),
+    'speed_x_slope': lambda s, a, sl: s * sl,
+    'speed2_x_slope': lambda s, a, sl: s * s * sl,
+    'speed_x_slope_abs': lambda s, a, sl: s * np.abs(sl),
+    'accel_x_speed': lambda s, a, sl: a * s,
+    'accel_x_speed2': lambda s, a, sl: a * s * s,
+    'total_effort': lambda s, a, sl: s + np.abs(sl) * 10 + np.abs(a) * 5,
+    'accel_per_speed': lambda s, a, sl: a / (s + 1),
+    'slope_per_speed': lambda s, a, sl: sl / (s + 1),
+}
+_DERIVED_INPUTS = ('speed_kmh', 'acceleration', 'slope')
+
+
+def _log_progress(downloaded: int, total_size: int, last_decile: int) -> int:
+    """Journalise la progression à chaque nouveau dixième, retourne le dixième courant"""
+    if total_size <= 0:
+        return last_decile
+    decile = downloaded * 10 // total_size
+    if decile != last_decile:
+        logger.info(f"   Progression: {decile * 10}%")
+    return decile
+
+
+def _checksum_ok(hasher: Any) -> bool:
+    """Compare le SHA-256 calculé pendant le téléchargement à MODEL_SHA256"""
+    if MODEL_SHA256 is None:
+        return True
+    if hasher.hexdigest() != MODEL_SHA256:
+        logger.error("❌ SHA-256 du modèle invalide")
+        return False
+    return True
+
+
+def _read_etag() -> Optional[str]:
+    """ETag de la version du modèle présente sur disque (model.etag)"""
+    etag_path = MODEL_PATH.with_suffix('.etag')
+    if not etag_path.exists():
+        return None
+    return etag_path.read_text().strip() or None
+
+
+def _save_etag(response: Any) -> None:
+    """Mémorise l'ETag de la réponse à côté du modèle (ou l'efface s'il n'y en a pas)"""
+    etag_path = MODEL_PATH.with_suffix('.etag')
+    etag = response.headers.get('ETag')
+    if etag:
+        etag_path.write_text(etag)
+    else:
+        etag_path.unlink(missing_ok=True)
+
+
+def _range_total(response: Any) -> Optional[int]:
+    """Taille totale du fichier distant d'après Content-Range (bytes */N), None si absente"""
+    total = response.headers.get('Content-Range', '').rpartition('/')[2]
+    return int(total) if total.isdigit() else None
+
+
+def download_to_memory() -> Optional[io.BytesIO]:
+    """Télécharge le modèle directement en mémoire (None s'il est trop gros)"""
+    response = requests.get(MODEL_URL, stream=True, timeout=300)
+    response.raise_for_status()
+    
+    total_size = int(response.headers.get('content-length', 0))
+    if not total_size or total_size > MODEL_INMEMORY_MAX_BYTES:
+        response.close()
+        return None
+    
+    logger.info(f"📥 Téléchargement en mémoire: {total_size / (1024*1024):.1f} MB")
+    buf = io.BytesIO()
+    hasher = hashlib.sha256()
+    last_decile = -1
+    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+        buf.write(chunk)
+        hasher.update(chunk)
+        last_decile = _log_progress(buf.tell(), total_size, last_decile)
+    
+    if not _checksum_ok(hasher):
+        raise ValueError("SHA-256 du modèle invalide")
+    
+    MODEL_DIR.mkdir(parents=True, exist_ok=True)
+    _save_etag(response)
+    buf.seek(0)
+    return buf
+
+
+def download_model(revalidate: bool = False) -> bool:
+    """Télécharge le modèle ML depuis GitHub Releases (reprise possible via .part)
 
-def download_model() -> bool:
-    """Télécharge le modèle ML depuis GitHub Releases"""
+    Avec revalidate=True, la requête est conditionnelle (If-None-Match sur l'ETag
+    enregistré): un 304 conserve le modèle présent sans rien transférer.
+    """
     logger.info(f"📥 Téléchargement du modèle XGBoost...")
     logger.info(f"   URL: {MODEL_URL}")
     
     MODEL_DIR.mkdir(parents=True, exist_ok=True)
+    part_path = MODEL_PATH.with_suffix('.part')
+    etag = _read_etag()
     
     try:
-        response = requests.get(MODEL_URL, stream=True, timeout=300)
-        response.raise_for_status()
+        headers = {}
+        if revalidate:
+            offset = 0
+            if etag:
+                headers['If-None-Match'] = etag
+        else:
+            offset = part_path.stat().st_size if part_path.exists() else 0
+            if offset:
+                headers['Range'] = f'bytes={offset}-'
+                # Reprise seulement si la version distante n'a pas changé (sinon 200 complet)
+                if etag and not etag.startswith('W/'):
+                    headers['If-Range'] = etag
+        
+        # Le SHA-256 couvre aussi la partie déjà téléchargée
+        hasher = hashlib.sha256()
+        if offset:
+            logger.info(f"   Reprise à {offset / (1024*1024):.1f} MB")
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+        
+        response = requests.get(MODEL_URL, stream=True, timeout=300, headers=headers)
         
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded = 0
+        if response.status_code == 304:
+            response.close()
+            logger.info("✅ Modèle à jour (304), aucun téléchargement")
+            return True
         
-        logger.info(f"   Taille: {total_size / (1024*1024):.1f} MB")
+        # 416: le .part n'est complet que s'il a la taille annoncée (Content-Range: bytes */N);
+        # sinon (.part périmé ou trop long) il est jeté et le téléchargement repart de zéro
+        if response.status_code == 416 and offset:
+            response.close()
+            if _range_total(response) != offset:
+                logger.warning("⚠️ Fichier partiel invalide, téléchargement depuis le début")
+                part_path.unlink(missing_ok=True)
+                return download_model()
+        else:
+            response.raise_for_status()
+            
+            # Serveur sans support Range ou fichier modifié: on repart de zéro
+            if response.status_code != 206:
+                offset = 0
+                hasher = hashlib.sha256()
+            
+            # Revalidation: le modèle en place garde son ETag jusqu'au remplacement
+            if not revalidate:
+                _save_etag(response)
+            
+            total_size = offset + int(response.headers.get('content-length', 0))
+            downloaded = offset
+            last_decile = -1
+            
+            logger.info(f"   Taille: {total_size / (1024*1024):.1f} MB")
+            
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    downloaded += len(chunk)
+                    last_decile = _log_progress(downloaded, total_size, last_decile)
         
-        with open(MODEL_PATH, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-                downloaded += len(chunk)
-                
-                if total_size > 0 and downloaded % (total_size // 10 + 1) < 8192:
-                    progress = (downloaded / total_size) * 100
-                    logger.info(f"   Progression: {progress:.0f}%")
+        if not _checksum_ok(hasher):
+            part_path.unlink(missing_ok=True)
+            return False
         
+        os.replace(part_path, MODEL_PATH)
+        if revalidate:
+            _save_etag(response)
         logger.info(f"✅ Modèle téléchargé: {MODEL_PATH}")
         return True
         
@@ -86,42 +310,105 @@ def download_model() -> bool:
         return False
 
 
+def _persist_from_memory(buf: io.BytesIO) -> None:
+    """Enregistre sur disque un modèle chargé depuis la mémoire (thread de fond)"""
+    try:
+        MODEL_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = MODEL_PATH.with_suffix('.tmp')
+        tmp_path.write_bytes(buf.getbuffer())
+        os.replace(tmp_path, MODEL_PATH)
+        logger.info(f"💾 Modèle enregistré: {MODEL_PATH}")
+    except Exception as e:
+        logger.warning(f"⚠️ Enregistrement du modèle impossible: {e}")
+
+
 def load_model() -> Optional[Any]:
-    """Charge le modèle ML avec joblib"""
-    global _model
-    
-    if _model is not None:
+    """Charge le modèle ML avec joblib (thread-safe, un seul téléchargement)"""
+    if _ctx is not None:
         logger.info("✅ Modèle déjà en mémoire")
-        return _model
+        return _ctx.model
+    
+    with _load_lock:
+        if _ctx is not None:
+            return _ctx.model
+        return _load_model_locked()
+
+
+async def ensure_loaded() -> Optional[Any]:
+    """Charge le modèle sans bloquer la boucle asyncio"""
+    if _ctx is not None:
+        return _ctx.model
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, load_model)
+
+
+def _load_model_locked() -> Optional[Any]:
+    """Télécharge si besoin puis charge le modèle (appelé sous _load_lock)"""
+    global _ctx
     
+    in_memory: Optional[io.BytesIO] = None
     if not MODEL_PATH.exists():
         logger.info("📦 Modèle non trouvé, téléchargement...")
-        success = download_model()
-        if not success:
-            logger.warning("⚠️ Impossible de télécharger le modèle")
-            return None
+        
+        # Petit modèle sans téléchargement partiel: chargé directement depuis la mémoire.
+        # Un échec (réseau, SHA-256) n'est pas retenté: seul un modèle trop gros ou
+        # sans Content-Length (None) passe par le téléchargement sur disque
+        if not MODEL_PATH.with_suffix('.part').exists():
+            try:
+                in_memory = download_to_memory()
+            except Exception as e:
+                logger.error(f"❌ Échec téléchargement: {e}")
+                logger.warning("⚠️ Impossible de télécharger le modèle")
+                return None
+        
+        if in_memory is None:
+            success = download_model()
+            if not success:
+                logger.warning("⚠️ Impossible de télécharger le modèle")
+                return None
+    elif MODEL_REVALIDATE and _read_etag() is not None:
+        logger.info("🔄 Revalidation du modèle (ETag)...")
+        if not download_model(revalidate=True):
+            logger.warning("⚠️ Revalidation impossible, modèle local conservé")
     
     try:
-        logger.info(f"📂 Chargement du modèle: {MODEL_PATH}...")
-        
-        model_data = joblib.load(MODEL_PATH)
+        if in_memory is not None:
+            logger.info("📂 Chargement du modèle depuis la mémoire...")
+            model_data = joblib.load(in_memory)
+            
+            # Persisté en arrière-plan pour le prochain démarrage
+            threading.Thread(
+                target=_persist_from_memory,
+                args=(in_memory,),
+                daemon=True
+            ).start()
+        else:
+            logger.info(f"📂 Chargement du modèle: {MODEL_PATH}...")
+            model_data = joblib.load(MODEL_PATH)
         
         if isinstance(model_data, dict):
-            _model = model_data.get('model')
+            model = model_data.get('model')
             features = model_data.get('features', [])
-            logger.info(f"✅ Modèle chargé: {type(_model).__name__}")
+            logger.info(f"✅ Modèle chargé: {type(model).__name__}")
             logger.info(f"   Features attendues: {len(features)}")
             logger.info(f"   R²: {model_data.get('r2', 'N/A')}")
             logger.info(f"   MAE: {model_data.get('mae', 'N/A')} kW")
             logger.info(f"   Vehicle: {model_data.get('vehicle_type', 'N/A')}")
         else:
-            _model = model_data
-            logger.info(f"✅ Modèle chargé: {type(_model).__name__}")
+            model = model_data
+            logger.info(f"✅ Modèle chargé: {type(model).__name__}")
         
-        if hasattr(_model, 'n_features_in_'):
-            logger.info(f"   Nombre de features: {_model.n_features_in_}")
-            
-        return _model
+        if hasattr(model, 'n_features_in_'):
+            logger.info(f"   Nombre de features: {model.n_features_in_}")
+        
+        _limit_threads(model)
+        ctx = _prepare_inference(model)
+        
+        # Publié en dernier: les prédictions concurrentes ne voient qu'un modèle prêt
+        _ctx = ctx
+        _notify_model_change()
+        _warmup()
+        return model
         
     except Exception as e:
         logger.error(f"❌ Échec chargement modèle: {e}")
@@ -130,51 +417,354 @@ def load_model() -> Optional[Any]:
         return None
 
 
-def get_model() -> Optional[Any]:
-    """Retourne le modèle chargé (ou None)"""
-    return _model
+def _limit_threads(model: Any) -> None:
+    """Force l'inférence mono-thread (une requête = un cœur)"""
+    try:
+        _limit_threads_rec(model)
+    except Exception as e:
+        logger.warning(f"⚠️ Impossible de limiter les threads du modèle: {e}")
+
+
+def _limit_threads_rec(model: Any) -> None:
+    """Applique n_jobs=1 au modèle et à ses sous-estimateurs (ensembles, pipelines)
+
+    Le predict des ensembles sklearn (Stacking/Voting) est séquentiel quel que soit
+    leur n_jobs: sur une ligne, c'est le joblib des membres (forêts...) qui coûte.
+    """
+    if isinstance(model, XGBRegressor):
+        model.set_params(n_jobs=1)
+        model.get_booster().set_param({'nthread': 1})
+        return
+    if hasattr(model, 'n_jobs'):
+        model.n_jobs = 1
+    
+    if hasattr(model, 'steps'):
+        members = [step for _, step in model.steps]
+    else:
+        members = []
+        estimators = getattr(model, 'estimators_', None)
+        if isinstance(estimators, (list, tuple)):
+            members.extend(estimators)
+        final_estimator = getattr(model, 'final_estimator_', None)
+        if final_estimator is not None:
+            members.append(final_estimator)
+    for member in members:
+        _limit_threads_rec(member)
+
+
+def _prepare_inference(model: Any) -> _ModelCtx:
+    """Fige l'ordre des features et prépare le chemin d'inférence"""
+    if hasattr(model, 'feature_names_in_'):
+        feats = tuple(model.feature_names_in_)
+    else:
+        feats = tuple(FEATURE_ORDER)
+    index = {name: i for i, name in enumerate(feats)}
+    n = len(feats)
+    
+    # Colonnes dérivées recalculées par _expand (si les features de base sont présentes)
+    if all(name in index for name in _DERIVED_INPUTS):
+        derived = tuple(
+            (index[name], formula)
+            for name, formula in DERIVED_FEATURES.items()
+            if name in index
+        )
+        base_cols = tuple(index[name] for name in _DERIVED_INPUTS)
+    else:
+        derived = tuple()
+        base_cols = tuple()
+    
+    derived_cols = {col for col, _ in derived}
+    key_names = [name for i, name in enumerate(feats) if i not in derived_cols]
+    key_cols = np.array([index[name] for name in key_names], dtype=np.intp)
+    key_scale = np.array(
+        [1 / CACHE_QUANTA.get(name, CACHE_QUANTUM) for name in key_names],
+        dtype=INPUT_DTYPE
+    )
+    
+    info = {"ml_model_loaded": True, "model_type": type(model).__name__}
+    if hasattr(model, 'n_features_in_'):
+        info["n_features"] = int(model.n_features_in_)
+    if hasattr(model, 'feature_names_in_'):
+        info["feature_names"] = tuple(model.feature_names_in_[:10].tolist())
+    
+    _pred_cache.clear()
+    
+    return _ModelCtx(
+        model=model,
+        predict=_select_backend(model, n),
+        feats=feats,
+        n=n,
+        derived=derived,
+        base_cols=base_cols,
+        key_cols=key_cols,
+        key_scale=key_scale,
+        info=info,
+    )
 
 
-def predict_with_model(features: dict) -> Optional[float]:
-    """Fait une prédiction avec le modèle ML"""
-    global _model
+def _select_backend(model: Any, n_features: int) -> Callable[[np.ndarray], np.ndarray]:
+    """Fonction de prédiction par bloc la plus rapide disponible pour ce modèle"""
+    session_predict = _compile_onnx(model, n_features)
+    if session_predict is not None:
+        return session_predict
     
-    if _model is None:
-        logger.warning("⚠️ Modèle non chargé, impossible de prédire")
+    daal_predict = _compile_daal(model, n_features)
+    if daal_predict is not None:
+        return daal_predict
+    
+    if isinstance(model, XGBRegressor):
+        # Booster XGBoost natif (évite la surcouche sklearn à chaque appel)
+        booster = model.get_booster()
+        # Même plage d'arbres que XGBRegressor.predict (early stopping)
+        best_iteration = booster.attr('best_iteration')
+        iteration_range = (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+        logger.info("   Inférence via Booster.inplace_predict")
+        return partial(booster.inplace_predict, iteration_range=iteration_range)
+    
+    return lambda X: np.asarray(model.predict(X))
+
+
+def _warmup() -> None:
+    """Prédiction factice: initialise le backend avant la 1re requête"""
+    try:
+        _predict_rows(np.zeros((1, _ctx.n), dtype=INPUT_DTYPE))
+    except Exception as e:
+        logger.warning(f"⚠️ Échec de la prédiction de préchauffage: {e}")
+
+
+def _compile_onnx(model: Any, n_features: int) -> Optional[Callable[[np.ndarray], np.ndarray]]:
+    """Compile le modèle en ONNX via Hummingbird si les dépendances sont installées"""
+    try:
+        from hummingbird.ml import convert
+        import onnxruntime as ort
+    except ImportError:
+        logger.info("   Hummingbird/onnxruntime absents - pas de compilation ONNX")
         return None
     
     try:
-        if hasattr(_model, 'feature_names_in_'):
-            expected_features = list(_model.feature_names_in_)
-        else:
-            expected_features = FEATURE_ORDER
+        test_input = np.zeros((1, n_features), dtype=INPUT_DTYPE)
+        compiled = convert(model, 'onnx', test_input)
+        
+        sess_options = ort.SessionOptions()
+        sess_options.intra_op_num_threads = 1
+        sess_options.inter_op_num_threads = 1
+        session = ort.InferenceSession(
+            compiled.model.SerializeToString(),
+            sess_options=sess_options,
+            providers=['CPUExecutionProvider']
+        )
+        input_name = session.get_inputs()[0].name
+        run = session.run
+        predict = lambda X: run(None, {input_name: X})[0].ravel()
+        
+        if not _reproduces(model, predict, n_features):
+            logger.warning("⚠️ Modèle ONNX divergent, conservé en mode natif")
+            return None
+        
+        logger.info("   Inférence via ONNX Runtime (Hummingbird)")
+        return predict
+        
+    except Exception as e:
+        logger.warning(f"⚠️ Compilation ONNX impossible: {e}")
+        return None
+
+
+def _compile_daal(model: Any, n_features: int) -> Optional[Callable[[np.ndarray], np.ndarray]]:
+    """Convertit un XGBRegressor en modèle daal4py (oneDAL) si daal4py est installé"""
+    if not isinstance(model, XGBRegressor):
+        return None
+    try:
+        import daal4py as d4p
+    except ImportError:
+        return None
+    
+    try:
+        daal_model = d4p.get_gbt_model_from_xgboost(model.get_booster())
+        # fptype='float': calcul en float32 comme les entrées, sans conversion en double
+        algorithm = d4p.gbt_regression_prediction(fptype='float')
+        predict = lambda X: algorithm.compute(X, daal_model).prediction.ravel()
+        
+        # Early stopping: oneDAL utilise tous les arbres, la vérification l'écarte alors
+        if not _reproduces(model, predict, n_features):
+            logger.warning("⚠️ Modèle daal4py divergent, conservé en mode natif")
+            return None
+        
+        logger.info("   Inférence via daal4py (oneDAL)")
+        return predict
         
-        feature_values = []
-        missing_features = []
+    except Exception as e:
+        logger.warning(f"⚠️ Conversion daal4py impossible: {e}")
+        return None
+
+
+def _reproduces(model: Any, predict: Callable[[np.ndarray], np.ndarray], n_features: int) -> bool:
+    """Le backend compilé doit reproduire le modèle d'origine sur un bloc de test"""
+    probe = np.random.default_rng(0).normal(size=(8, n_features)).astype(INPUT_DTYPE)
+    expected = np.asarray(model.predict(probe), dtype=INPUT_DTYPE).ravel()
+    got = np.asarray(predict(probe), dtype=INPUT_DTYPE).ravel()
+    return got.shape == expected.shape and np.allclose(got, expected, rtol=1e-3, atol=1e-3)
+
+
+def _cache_key(row: np.ndarray, ctx: _ModelCtx) -> Optional[bytes]:
+    """Clé de cache d'une ligne (n,) avant _expand
+
+    None si le cache est désactivé ou si une valeur n'est pas finie (NaN et
+    infinis donneraient tous le même entier).
+    """
+    if PREDICTION_CACHE_SIZE <= 0:
+        return None
+    values = row[ctx.key_cols]
+    if not np.isfinite(values).all():
+        return None
+    return np.rint(values * ctx.key_scale).astype(np.int64).tobytes()
+
+
+def get_model() -> Optional[Any]:
+    """Retourne le modèle chargé (ou None)"""
+    ctx = _ctx
+    return ctx.model if ctx is not None else None
+
+
+_NO_MODEL_INFO = {"ml_model_loaded": False, "model_type": None}
+
+
+def get_model_info() -> dict:
+    """Métadonnées du modèle chargé, calculées une seule fois au chargement (lecture seule)"""
+    ctx = _ctx
+    return ctx.info if ctx is not None else _NO_MODEL_INFO
+
+
+def on_model_change(callback: Callable[[], None]) -> Callable[[], None]:
+    """Décorateur: appelle callback tout de suite, puis à chaque modèle publié"""
+    _model_listeners.append(callback)
+    callback()
+    return callback
+
+
+def _notify_model_change() -> None:
+    """Prévient les abonnés de on_model_change qu'un nouveau modèle est publié"""
+    for callback in _model_listeners:
+        try:
+            callback()
+        except Exception as e:
+            logger.warning(f"⚠️ Échec du rappel {callback.__name__}: {e}")
+
+
+def _expand(X: np.ndarray, ctx: _ModelCtx) -> None:
+    """Recalcule en place les colonnes dérivées d'une ligne (n,) ou d'un bloc (m, n)"""
+    if not ctx.derived:
+        return
+    speed_col, accel_col, slope_col = ctx.base_cols
+    speed = X[..., speed_col]
+    accel = X[..., accel_col]
+    slope = X[..., slope_col]
+    for col, formula in ctx.derived:
+        X[..., col] = formula(speed, accel, slope)
+
+
+def _predict_rows(X: np.ndarray) -> np.ndarray:
+    """Prédit un bloc (n, features) avec le backend le plus rapide disponible"""
+    return _ctx.predict(X)
+
+
+def get_feature_names() -> tuple:
+    """Ordre des colonnes attendu par predict_with_array / predict_batched"""
+    ctx = _ctx
+    return ctx.feats if ctx is not None else tuple()
+
+
+def predict_with_array(X: np.ndarray) -> Optional[float]:
+    """Prédit une ligne (1, n) déjà ordonnée selon get_feature_names()
+
+    Les colonnes dérivées (DERIVED_FEATURES) sont recalculées en place.
+    """
+    ctx = _ctx
+    if ctx is None:
+        return None
+    
+    try:
+        key = _cache_key(X[0], ctx)
+        if key is not None:
+            cached = _pred_cache.get(key)
+            if cached is not None:
+                return cached
         
-        for feat in expected_features:
-            if feat in features:
-                try:
-                    value = float(features[feat])
-                except (ValueError, TypeError):
-                    value = 0.0
-                    missing_features.append(feat)
-                feature_values.append(value)
-            else:
-                missing_features.append(feat)
-                feature_values.append(0.0)
+        _expand(X, ctx)
+        prediction = float(ctx.predict(X)[0])
         
-        if missing_features and len(missing_features) <= 5:
-            logger.debug(f"Features manquantes: {missing_features}")
+        if key is not None:
+            _pred_cache.put(key, prediction)
+        return prediction
         
-        X = np.array(feature_values, dtype=np.float64).reshape(1, -1)
-        prediction = _model.predict(X)[0]
+    except Exception as e:
+        logger.error("❌ Erreur prédiction: %s", e)
+        return None
+
+
+# ============================================
+# MICRO-BATCHING
+# ============================================
+class Batcher(Coalescer):
+    """Regroupe les prédictions concurrentes en un seul appel au modèle"""
+    
+    def __init__(self, max_batch: int = 64, max_wait_ms: float = 2):
+        super().__init__(max_batch, max_wait_ms)
+        # Un seul lot en vol à la fois: un bloc (max_batch, n) réutilisé d'un lot à l'autre
+        self._buf: Optional[np.ndarray] = None
+    
+    def _stack(self, rows: list) -> np.ndarray:
+        """Copie les lignes du lot dans le bloc préalloué"""
+        n_features = rows[0].shape[-1]
+        if self._buf is None or self._buf.shape[1] != n_features:
+            self._buf = np.empty((self.max_batch, n_features), dtype=INPUT_DTYPE)
+        X = self._buf[:len(rows)]
+        for i, row in enumerate(rows):
+            X[i] = row
+        return X
+    
+    async def _process(self, rows: list) -> list:
+        X = self._stack(rows)
+        loop = asyncio.get_running_loop()
+        predictions = await loop.run_in_executor(_executor, _predict_rows, X)
+        return predictions.tolist()
+
+
+_batcher = Batcher()
+
+
+def start_batcher() -> None:
+    """Démarre le micro-batcher (lifespan de l'application)"""
+    _batcher.start()
+
+
+async def stop_batcher() -> None:
+    """Arrête le micro-batcher (lifespan de l'application)"""
+    await _batcher.stop()
+
+
+async def predict_batched(row: np.ndarray) -> Optional[float]:
+    """Prédit une ligne (n,) ordonnée selon get_feature_names() via le micro-batcher"""
+    ctx = _ctx
+    if ctx is None:
+        return None
+    if not _batcher.running:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, predict_with_array, row.reshape(1, -1))
+    
+    try:
+        key = _cache_key(row, ctx)
+        if key is not None:
+            cached = _pred_cache.get(key)
+            if cached is not None:
+                return cached
         
-        speed = features.get('speed_kmh', 0)
-        logger.debug(f"✅ Prédiction ML: {prediction:.2f} kW @ {speed:.1f} km/h")
+        _expand(row, ctx)
+        prediction = await _batcher.submit(row)
         
-        return float(prediction)
+        if key is not None:
+            _pred_cache.put(key, prediction)
+        return prediction
         
     except Exception as e:
-        logger.error(f"❌ Erreur prédiction: {e}")
+        logger.error("❌ Erreur prédiction: %s", e)
         return None
\ No newline at end of file
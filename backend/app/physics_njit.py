@@ -0,0 +1,95 @@
+"""
+Modèle physique compilé (Numba) - Puissance batterie à partir du bilan des forces
+"""
+import math
+
+try:
+    from numba import njit
+except ImportError:
+    # Sans Numba: mêmes fonctions, exécutées en Python pur
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+RHO = 1.225  # Densité de l'air (kg/m³)
+G = 9.81     # Gravité (m/s²)
+
+
+@njit(cache=True, fastmath=True)
+def power_kw(speed_kmh, acceleration, slope, ambient_temp, k_aero, k_roll, k_grav, mass, efficiency):
+    """Puissance batterie (kW) à partir de scalaires float
+
+    k_aero = 0.5·ρ·CdA, k_roll = Crr·m·g et k_grav = m·g sont précalculés par véhicule.
+    """
+    speed_ms = speed_kmh / 3.6
+    slope_rad = math.atan(slope / 100.0)
+    
+    # Forces
+    f_total = (
+        k_aero * speed_ms * speed_ms
+        + k_roll * math.cos(slope_rad)
+        + k_grav * math.sin(slope_rad)
+        + mass * acceleration
+    )
+    p_wheels = f_total * speed_ms / 1000.0
+    
+    # Efficacité motrice / régénération
+    if p_wheels > 0:
+        power = p_wheels / efficiency
+    else:
+        power = p_wheels * 0.7
+    
+    # Auxiliaires (HVAC)
+    aux = 2.0 if (ambient_temp < 10 or ambient_temp > 25) else 0.5
+    return power + aux
+
+
+@njit(cache=True)
+def optimal_speed_kmh(speed_kmh, slope, soc):
+    """Vitesse optimale (km/h) selon la pente, le SOC et la vitesse actuelle"""
+    # Vitesse optimale de base
+    optimal = 85.0
+    
+    # Ajustements selon pente
+    if slope > 5:
+        optimal = min(70.0, optimal)
+    elif slope > 2:
+        optimal = min(80.0, optimal)
+    elif slope < -3:
+        optimal = max(90.0, optimal)
+    
+    # Ajustements selon SOC
+    if soc < 20:
+        optimal = min(70.0, optimal)
+    elif soc < 30:
+        optimal = min(80.0, optimal)
+    
+    # Ne pas recommander plus vite si déjà lent
+    if speed_kmh > 0 and speed_kmh < 50:
+        optimal = min(speed_kmh + 10.0, optimal)
+    
+    return optimal
+
+
+def make_power_kw(k_aero, k_roll, k_grav, mass, efficiency):
+    """Spécialise power_kw pour un véhicule: ses constantes sont figées dans le code compilé
+
+    Numba traite les variables de la fermeture comme des constantes de compilation.
+    Pas de cache disque (non supporté pour une fermeture): compilée à la création.
+    """
+    @njit(fastmath=True)
+    def vehicle_power_kw(speed_kmh, acceleration, slope, ambient_temp):
+        return power_kw(
+            speed_kmh, acceleration, slope, ambient_temp,
+            k_aero, k_roll, k_grav, mass, efficiency,
+        )
+    
+    vehicle_power_kw(0.0, 0.0, 0.0, 15.0)
+    return vehicle_power_kw
+
+
+# Compilation à l'import (ou chargement du cache) pour épargner la 1re requête
+power_kw(0.0, 0.0, 0.0, 15.0, 0.36, 186.4, 18639.0, 1900.0, 0.88)
+optimal_speed_kmh(0.0, 0.0, 80.0)
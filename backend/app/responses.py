@@ -0,0 +1,21 @@
+"""
+Réponses JSON - Sérialisation orjson
+"""
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def dumps(content: Any) -> bytes:
+    """Encode en JSON avec orjson (extension C, gère les scalaires numpy)"""
+    return orjson.dumps(
+        content,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    )
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse encodée avec orjson"""
+    
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
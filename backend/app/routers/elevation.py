@@ -3,16 +3,57 @@ Router d'élévation - Utilise OpenTopoData eudem25m
 """
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Any, List, Optional
 import httpx
 import math
 import logging
 
+from app.coalescer import Coalescer
+from app.lru import LRUCache
+from app.responses import ORJSONResponse
+
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/api/elevation", tags=["elevation"])
+router = APIRouter(prefix="/api/elevation", tags=["elevation"], default_response_class=ORJSONResponse)
 
 ELEVATION_API_URL = "https://api.opentopodata.org/v1/eudem25m"
 
+# Cache LRU des élévations: coordonnées arrondies à 1e-5° (~1 m), même point = même élévation
+ELEVATION_CACHE_SIZE = 16384
+_elevation_cache = LRUCache(ELEVATION_CACHE_SIZE)
+
+# Client HTTP partagé: connexions TCP/TLS (HTTP/2) réutilisées entre requêtes
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Retourne le client partagé (créé à la demande si start_client n'a pas été appelé)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=30.0,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+        )
+    return _client
+
+
+async def start_client() -> None:
+    """Ouvre le client partagé (lifespan de l'application)"""
+    _get_client()
+
+
+async def close_client() -> None:
+    """Ferme le client partagé (lifespan de l'application)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _cache_key(latitude: float, longitude: float) -> tuple:
+    """Clé de cache quantifiée (~1 m)"""
+    return (round(latitude * 1e5), round(longitude * 1e5))
+
 
 class GPSPoint(BaseModel):
     latitude: float = Field(..., ge=-90, le=90)
@@ -30,32 +71,100 @@ class ElevationResponse(BaseModel):
     source: str = "eudem25m"
 
 
+async def _fetch_elevations(coords: List[tuple], timeout: Any = httpx.USE_CLIENT_DEFAULT) -> List[Optional[float]]:
+    """Interroge OpenTopoData en un seul appel (une fois par point distinct), met en cache
+
+    Retourne les élévations dans l'ordre de coords; lève HTTPException(503) si le
+    service ne répond pas OK.
+    """
+    keys = [_cache_key(latitude, longitude) for latitude, longitude in coords]
+    uniq = {}
+    order = []
+    for i, key in enumerate(keys):
+        if key not in uniq:
+            uniq[key] = len(order)
+            order.append(i)
+    
+    response = await _get_client().get(
+        ELEVATION_API_URL,
+        params={
+            "locations": "|".join(f"{coords[i][0]},{coords[i][1]}" for i in order),
+            "interpolation": "bilinear"
+        },
+        timeout=timeout
+    )
+    
+    data = response.json() if response.status_code == 200 else {}
+    results = data.get("results")
+    if data.get("status") != "OK" or not results:
+        raise HTTPException(status_code=503, detail="Service d'élévation indisponible")
+    
+    fetched = [result.get("elevation") for result in results]
+    for i, elevation in zip(order, fetched):
+        if elevation is not None:
+            _elevation_cache.put(keys[i], elevation)
+    
+    # Redistribution vers tous les points (doublons compris)
+    return [fetched[j] if j < len(fetched) else None for j in (uniq[key] for key in keys)]
+
+
+# ============================================
+# REGROUPEMENT DES REQUÊTES /single
+# ============================================
+class ElevationCoalescer(Coalescer):
+    """Regroupe les requêtes /single concurrentes en un seul appel OpenTopoData"""
+    
+    # Un lot par tâche: un OpenTopoData lent ne retient pas les requêtes suivantes
+    concurrent = True
+    
+    def __init__(self, max_batch: int = 100, window_ms: float = 50):
+        super().__init__(max_batch, window_ms)
+    
+    async def _process(self, coords: list) -> list:
+        return await _fetch_elevations(coords, timeout=10.0)
+
+
+_coalescer = ElevationCoalescer()
+
+
+def start_coalescer() -> None:
+    """Démarre le regroupement des requêtes /single (lifespan de l'application)"""
+    _coalescer.start()
+
+
+async def stop_coalescer() -> None:
+    """Arrête le regroupement des requêtes /single (lifespan de l'application)"""
+    await _coalescer.stop()
+
+
 @router.get("/single")
 async def get_single_elevation(latitude: float, longitude: float):
     """Obtenir l'élévation d'un point GPS"""
+    key = _cache_key(latitude, longitude)
+    cached = _elevation_cache.get(key)
+    if cached is not None:
+        return {
+            "latitude": latitude,
+            "longitude": longitude,
+            "elevation": cached,
+            "source": "eudem25m"
+        }
+    
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                ELEVATION_API_URL,
-                params={
-                    "locations": f"{latitude},{longitude}",
-                    "interpolation": "bilinear"
-                }
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("status") == "OK" and data.get("results"):
-                    elevation = data["results"][0].get("elevation")
-                    return {
-                        "latitude": latitude,
-                        "longitude": longitude,
-                        "elevation": elevation,
-                        "source": "eudem25m"
-                    }
-            
-            raise HTTPException(status_code=503, detail="Service d'élévation indisponible")
+        if _coalescer.running:
+            elevation = await _coalescer.submit((latitude, longitude))
+        else:
+            elevation = (await _fetch_elevations([(latitude, longitude)], timeout=10.0))[0]
+        
+        return {
+            "latitude": latitude,
+            "longitude": longitude,
+            "elevation": elevation,
+            "source": "eudem25m"
+        }
             
+    except HTTPException:
+        raise
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="Timeout service d'élévation")
     except Exception as e:
@@ -69,43 +178,22 @@ async def get_elevations(points: List[GPSPoint]):
     if len(points) > 100:
         raise HTTPException(status_code=400, detail="Maximum 100 points")
     
-    locations = "|".join([f"{p.latitude},{p.longitude}" for p in points])
+    # Seuls les points absents du cache sont demandés à OpenTopoData
+    elevations = [_elevation_cache.get(_cache_key(p.latitude, p.longitude)) for p in points]
+    missing = [i for i, elevation in enumerate(elevations) if elevation is None]
     
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                ELEVATION_API_URL,
-                params={
-                    "locations": locations,
-                    "interpolation": "bilinear"
-                }
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("status") == "OK" and data.get("results"):
-                    result_points = []
-                    for i, result in enumerate(data["results"]):
-                        result_points.append(ElevationPoint(
-                            latitude=points[i].latitude,
-                            longitude=points[i].longitude,
-                            elevation=result.get("elevation") or 0
-                        ))
-                    return ElevationResponse(points=result_points)
-            
-            # Fallback: retourner des zéros
-            return ElevationResponse(
-                points=[
-                    ElevationPoint(latitude=p.latitude, longitude=p.longitude, elevation=0)
-                    for p in points
-                ]
-            )
-            
-    except Exception as e:
-        logger.error(f"Erreur batch élévation: {e}")
-        return ElevationResponse(
-            points=[
-                ElevationPoint(latitude=p.latitude, longitude=p.longitude, elevation=0)
-                for p in points
-            ]
-        )
\ No newline at end of file
+    if missing:
+        try:
+            fetched = await _fetch_elevations([(points[i].latitude, points[i].longitude) for i in missing])
+            for i, elevation in zip(missing, fetched):
+                elevations[i] = elevation
+        except Exception as e:
+            logger.error(f"Erreur batch élévation: {e}")
+    
+    # Fallback: 0 pour les points sans élévation
+    return ElevationResponse(
+        points=[
+            ElevationPoint(latitude=p.latitude, longitude=p.longitude, elevation=elevation or 0)
+            for p, elevation in zip(points, elevations)
+        ]
+    )
@@ -1,16 +1,21 @@
 """
 Router de prédiction - Utilise le vrai modèle ML
 """
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, Field, ValidationError
 from typing import Optional
+from collections import namedtuple
+from math import isfinite
 import numpy as np
 import logging
 
-from app.models.ml_model import get_model, predict_with_model
+from app.models.ml_model import INPUT_DTYPE, get_feature_names, get_model, get_model_info, on_model_change, predict_batched
+from app.physics_njit import G, RHO, make_power_kw, optimal_speed_kmh
+from app.responses import ORJSONResponse, dumps
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/api/predict", tags=["prediction"])
+router = APIRouter(prefix="/api/predict", tags=["prediction"], default_response_class=ORJSONResponse)
 
 
 # ============================================
@@ -18,36 +23,41 @@ router = APIRouter(prefix="/api/predict", tags=["prediction"])
 # ============================================
 
 class FeaturesRequest(BaseModel):
-    """Les 36 features calculées par le frontend"""
+    """Les 36 features calculées par le frontend
+
+    Les features dérivées (speed2, speed3, slope_abs, interactions, total_effort,
+    ratios) sont recalculées par le serveur à partir de speed_kmh, acceleration
+    et slope: les valeurs envoyées sont ignorées et peuvent être omises.
+    """
     # Base features (11)
-    speed_kmh: float = Field(default=0, ge=0, le=250)
-    speed2: float = Field(default=0)
-    speed3: float = Field(default=0)
-    acceleration: float = Field(default=0)
-    slope: float = Field(default=0)
-    slope_abs: float = Field(default=0)
-    elevation_diff: float = Field(default=0)
-    VCFRONT_tempAmbient: float = Field(default=15)
+    speed_kmh: float = Field(default=0.0, ge=0, le=250)
+    speed2: float = Field(default=0.0)
+    speed3: float = Field(default=0.0)
+    acceleration: float = Field(default=0.0)
+    slope: float = Field(default=0.0)
+    slope_abs: float = Field(default=0.0)
+    elevation_diff: float = Field(default=0.0)
+    VCFRONT_tempAmbient: float = Field(default=15.0)
     temp_range: float = Field(default=3.0)
-    SOCave292: float = Field(default=80, ge=0, le=100)
-    soc_delta: float = Field(default=0)
+    SOCave292: float = Field(default=80.0, ge=0, le=100)
+    soc_delta: float = Field(default=0.0)
     
     # Interaction features (6)
-    speed_x_slope: float = Field(default=0)
-    speed2_x_slope: float = Field(default=0)
-    speed_x_slope_abs: float = Field(default=0)
-    accel_x_speed: float = Field(default=0)
-    accel_x_speed2: float = Field(default=0)
-    total_effort: float = Field(default=0)
+    speed_x_slope: float = Field(default=0.0)
+    speed2_x_slope: float = Field(default=0.0)
+    speed_x_slope_abs: float = Field(default=0.0)
+    accel_x_speed: float = Field(default=0.0)
+    accel_x_speed2: float = Field(default=0.0)
+    total_effort: float = Field(default=0.0)
     
     # Rolling features (7)
-    speed_roll_mean_10: float = Field(default=0)
-    speed_roll_std_10: float = Field(default=0)
-    speed_roll_max_10: float = Field(default=0)
-    speed_roll_min_10: float = Field(default=0)
-    accel_roll_mean_5: float = Field(default=0)
-    accel_roll_std_5: float = Field(default=0)
-    slope_roll_mean_20: float = Field(default=0)
+    speed_roll_mean_10: float = Field(default=0.0)
+    speed_roll_std_10: float = Field(default=0.0)
+    speed_roll_max_10: float = Field(default=0.0)
+    speed_roll_min_10: float = Field(default=0.0)
+    accel_roll_mean_5: float = Field(default=0.0)
+    accel_roll_std_5: float = Field(default=0.0)
+    slope_roll_mean_20: float = Field(default=0.0)
     
     # Binary state features (4)
     is_accelerating: int = Field(default=0, ge=0, le=1)
@@ -56,9 +66,9 @@ class FeaturesRequest(BaseModel):
     regen_potential: int = Field(default=0, ge=0, le=1)
     
     # Cumulative features (3)
-    cumul_elevation_gain: float = Field(default=0)
-    cumul_elevation_loss: float = Field(default=0)
-    time_since_stop: float = Field(default=0)
+    cumul_elevation_gain: float = Field(default=0.0)
+    cumul_elevation_loss: float = Field(default=0.0)
+    time_since_stop: float = Field(default=0.0)
     
     # Categorical features (3)
     speed_regime: int = Field(default=0, ge=0, le=3)
@@ -66,8 +76,8 @@ class FeaturesRequest(BaseModel):
     temp_category: int = Field(default=2, ge=0, le=4)
     
     # Ratio features (2)
-    accel_per_speed: float = Field(default=0)
-    slope_per_speed: float = Field(default=0)
+    accel_per_speed: float = Field(default=0.0)
+    slope_per_speed: float = Field(default=0.0)
 
 
 class PredictionRequest(BaseModel):
@@ -76,6 +86,11 @@ class PredictionRequest(BaseModel):
     features: FeaturesRequest
 
 
+# Schéma du corps publié dans l'OpenAPI: la route lit le corps brut (voir predict_power)
+_REQUEST_SCHEMA = PredictionRequest.model_json_schema()
+_REQUEST_SCHEMA["properties"]["features"] = _REQUEST_SCHEMA.pop("$defs")["FeaturesRequest"]
+
+
 class PredictionResponse(BaseModel):
     """Réponse avec prédiction"""
     battery_power_kw: float
@@ -96,85 +111,52 @@ VEHICLE_SPECS = {
     "BEV2": {"mass": 2000, "cd_a": 0.59, "crr": 0.01, "efficiency": 0.88, "capacity": 78.8},
 }
 
+# Présentation des véhicules (/models)
+AVAILABLE_VEHICLES = ["BEV1", "BEV2"]
+VEHICLE_INFO = {
+    "BEV1": {"name": "Tesla Model Y SR", "battery": "60.5 kWh", "chemistry": "LFP"},
+    "BEV2": {"name": "Tesla Model Y LR", "battery": "78.8 kWh", "chemistry": "NCA"},
+}
+
+# Constantes physiques précalculées par véhicule (hors du chemin chaud)
+_Phys = namedtuple("_Phys", "k_aero k_roll k_grav mass eff")
+_PHYS = {
+    vehicle: _Phys(
+        k_aero=0.5 * RHO * specs["cd_a"],
+        k_roll=specs["crr"] * specs["mass"] * G,
+        k_grav=specs["mass"] * G,
+        mass=float(specs["mass"]),
+        eff=specs["efficiency"],
+    )
+    for vehicle, specs in VEHICLE_SPECS.items()
+}
+
+# Modèle physique compilé par véhicule (constantes figées, aucune recherche par appel)
+_PHYSICS_BY_TYPE = {vehicle: make_power_kw(*p) for vehicle, p in _PHYS.items()}
+
 
-def physics_prediction(features: dict, vehicle_type: str = "BEV1") -> float:
+def physics_prediction(features: FeaturesRequest, vehicle_type: str = "BEV1") -> float:
     """Prédiction physique (fallback si ML indisponible)"""
-    specs = VEHICLE_SPECS.get(vehicle_type, VEHICLE_SPECS["BEV1"])
-    
-    speed_kmh = features.get("speed_kmh", 0)
-    acceleration = features.get("acceleration", 0)
-    slope = features.get("slope", 0)
-    ambient_temp = features.get("VCFRONT_tempAmbient", 15)
-    
-    mass = specs["mass"]
-    cd_a = specs["cd_a"]
-    crr = specs["crr"]
-    efficiency = specs["efficiency"]
-    
-    speed_ms = speed_kmh / 3.6
-    slope_rad = np.arctan(slope / 100)
-    rho = 1.225
-    g = 9.81
-    
-    # Forces
-    F_aero = 0.5 * rho * cd_a * speed_ms ** 2
-    F_roll = crr * mass * g * np.cos(slope_rad)
-    F_grade = mass * g * np.sin(slope_rad)
-    F_accel = mass * acceleration
-    
-    F_total = F_aero + F_roll + F_grade + F_accel
-    P_wheels = F_total * speed_ms / 1000  # kW
-    
-    # Puissance batterie avec efficacité
-    if P_wheels > 0:
-        power_kw = P_wheels / efficiency
-    else:
-        power_kw = P_wheels * 0.7  # Efficacité régénération
+    vehicle_power_kw = _PHYSICS_BY_TYPE.get(vehicle_type) or _PHYSICS_BY_TYPE["BEV1"]
     
-    # Auxiliaires (HVAC)
-    aux = 0.5
-    if ambient_temp < 10 or ambient_temp > 25:
-        aux += 1.5
-    power_kw += aux
-    
-    return power_kw
+    return vehicle_power_kw(
+        features.speed_kmh,
+        features.acceleration,
+        features.slope,
+        features.VCFRONT_tempAmbient,
+    )
 
 
-def calculate_optimal_speed(features: dict, vehicle_type: str = "BEV1") -> float:
+def calculate_optimal_speed(features: FeaturesRequest, vehicle_type: str = "BEV1") -> float:
     """Calcule la vitesse optimale"""
-    speed = features.get("speed_kmh", 0)
-    slope = features.get("slope", 0)
-    soc = features.get("SOCave292", 80)
-    
-    # Vitesse optimale de base
-    optimal = 85
-    
-    # Ajustements selon pente
-    if slope > 5:
-        optimal = min(70, optimal)
-    elif slope > 2:
-        optimal = min(80, optimal)
-    elif slope < -3:
-        optimal = max(90, optimal)
-    
-    # Ajustements selon SOC
-    if soc < 20:
-        optimal = min(70, optimal)
-    elif soc < 30:
-        optimal = min(80, optimal)
-    
-    # Ne pas recommander plus vite si déjà lent
-    if speed > 0 and speed < 50:
-        optimal = min(speed + 10, optimal)
-    
-    return optimal
+    return optimal_speed_kmh(features.speed_kmh, features.slope, features.SOCave292)
 
 
-def generate_recommendation(power: float, features: dict) -> tuple:
+def generate_recommendation(power: float, features: FeaturesRequest) -> tuple:
     """Génère une recommandation de conduite"""
-    speed = features.get("speed_kmh", 0)
-    slope = features.get("slope", 0)
-    acceleration = features.get("acceleration", 0)
+    speed = features.speed_kmh
+    slope = features.slope
+    acceleration = features.acceleration
     
     # Régénération active
     if power < -5:
@@ -221,12 +203,76 @@ def generate_recommendation(power: float, features: dict) -> tuple:
     return ("Conduite normale", "info")
 
 
+def _round2(x: float) -> float:
+    """Arrondi à 2 décimales (demi vers l'extérieur), plus rapide que round(x, 2) sur un float
+
+    NaN et infinis (int() lèverait une erreur) passent par round(), comme avant.
+    """
+    y = x * 100
+    if not isfinite(y):
+        return round(x, 2)
+    return (int(y + 0.5) if x >= 0 else -int(0.5 - y)) / 100
+
+
+# Constructeurs de ligne générés, par ordre de features du modèle
+_row_builders: dict = {}
+
+
+def _compile_row_builder(feature_names: tuple):
+    """Génère FeaturesRequest -> ligne déroulée (lectures d'attributs, sans boucle)
+
+    Une feature du modèle absente du schéma vaut 0.0.
+    """
+    fields = FeaturesRequest.model_fields
+    values = ", ".join(f"f.{name}" if name in fields else "0.0" for name in feature_names)
+    source = f"def _row(f):\n    return array([{values}], dtype=dtype)"
+    namespace = {"array": np.array, "dtype": INPUT_DTYPE}
+    exec(compile(source, "<features_row>", "exec"), namespace)
+    return namespace["_row"]
+
+
+def features_to_array(features: FeaturesRequest) -> np.ndarray:
+    """Ligne de features (déjà validées par Pydantic) dans l'ordre attendu par le modèle"""
+    names = get_feature_names()
+    build = _row_builders.get(names)
+    if build is None:
+        build = _row_builders[names] = _compile_row_builder(names)
+    return build(features)
+
+
+def _is_json(content_type: Optional[str]) -> bool:
+    """Même règle que FastAPI: application/json ou application/*+json"""
+    if not content_type:
+        return False
+    main, _, sub = content_type.partition(";")[0].strip().lower().partition("/")
+    return main == "application" and (sub == "json" or sub.endswith("+json"))
+
+
 # ============================================
 # ENDPOINTS
 # ============================================
 
-@router.post("", response_model=PredictionResponse)
-async def predict_power(request: PredictionRequest):
+# Libellé du modèle et confiance associée (réponse de /api/predict)
+_MODEL_LABEL_ML = "ML (XGBoost)"
+_MODEL_LABEL_PHYS = "Physics (fallback)"
+_CONF_ML = 0.92
+_CONF_PHYS = 0.75
+_STATIONARY_MSG = "Véhicule à l'arrêt"
+
+
+@router.post(
+    "",
+    # Réponse construite par le code: documentée mais pas revalidée à chaque requête
+    response_model=None,
+    responses={200: {"model": PredictionResponse}},
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _REQUEST_SCHEMA}},
+        }
+    },
+)
+async def predict_power(http_request: Request) -> ORJSONResponse:
     """
     Prédit la consommation avec le modèle ML
     
@@ -236,81 +282,102 @@ async def predict_power(request: PredictionRequest):
     - Vitesse optimale
     - Recommandation de conduite
     """
-    features_dict = request.features.model_dump()
+    # Validation directe du JSON brut par pydantic-core (mêmes contraintes, sans
+    # passer par json.loads puis un dict Python intermédiaire)
+    body = await http_request.body()
+    if not _is_json(http_request.headers.get("content-type")):
+        # Comme FastAPI: un corps non JSON (text/plain...) n'est pas décodé. Sinon une
+        # requête CORS "simple" contournerait le preflight et la liste d'origines
+        raise RequestValidationError([{
+            "type": "model_attributes_type",
+            "loc": ("body",),
+            "msg": "Input should be a valid dictionary or object to extract fields from",
+            "input": body,
+        }])
+    try:
+        request = PredictionRequest.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+    
+    features = request.features
     vehicle_type = request.vehicle_type
     
     # Essayer le modèle ML d'abord
-    model = get_model()
-    power_kw = None
-    model_used = "Physics (fallback)"
-    
-    if model is not None:
-        power_kw = predict_with_model(features_dict)
-        if power_kw is not None:
-            model_used = "ML (XGBoost)"
-            logger.info(f"✅ Prédiction ML: {power_kw:.2f} kW")
+    # None si le modèle n'est pas chargé (un seul accès au modèle, dans predict_batched)
+    power_kw = await predict_batched(features_to_array(features))
+    used_ml = power_kw is not None
+    if used_ml:
+        logger.info("✅ Prédiction ML: %.2f kW", power_kw)
     
     # Fallback sur modèle physique
     if power_kw is None:
-        power_kw = physics_prediction(features_dict, vehicle_type)
-        logger.info(f"⚠️ Fallback physique: {power_kw:.2f} kW")
+        power_kw = physics_prediction(features, vehicle_type)
+        logger.info("⚠️ Fallback physique: %.2f kW", power_kw)
+    
+    # Véhicule à l'arrêt: ni efficacité, ni vitesse optimale, ni conseil de conduite
+    speed = features.speed_kmh
+    if speed <= 1:
+        return ORJSONResponse({
+            "battery_power_kw": _round2(power_kw),
+            "efficiency_kwh_100km": 0.0,
+            "confidence": _CONF_ML if used_ml else _CONF_PHYS,
+            "optimal_speed": None,
+            "recommendation_message": _STATIONARY_MSG,
+            "recommendation_type": "info",
+            "model_used": _MODEL_LABEL_ML if used_ml else _MODEL_LABEL_PHYS
+        })
     
     # Efficacité
-    speed = features_dict.get("speed_kmh", 0)
-    efficiency = (power_kw / speed * 100) if speed > 1 else 0
+    efficiency = power_kw / speed * 100
     
     # Vitesse optimale
-    optimal_speed = calculate_optimal_speed(features_dict, vehicle_type)
+    optimal_speed = calculate_optimal_speed(features, vehicle_type)
     
     # Recommandation
-    rec_message, rec_type = generate_recommendation(power_kw, features_dict)
-    
-    # Confiance
-    confidence = 0.92 if "ML" in model_used else 0.75
-    
-    return PredictionResponse(
-        battery_power_kw=round(power_kw, 2),
-        efficiency_kwh_100km=round(efficiency, 2),
-        confidence=confidence,
-        optimal_speed=round(optimal_speed),
-        recommendation_message=rec_message,
-        recommendation_type=rec_type,
-        model_used=model_used
-    )
+    rec_message, rec_type = generate_recommendation(power_kw, features)
+    
+    return ORJSONResponse({
+        "battery_power_kw": _round2(power_kw),
+        "efficiency_kwh_100km": _round2(efficiency),
+        "confidence": _CONF_ML if used_ml else _CONF_PHYS,
+        "optimal_speed": float(round(optimal_speed)),
+        "recommendation_message": rec_message,
+        "recommendation_type": rec_type,
+        "model_used": _MODEL_LABEL_ML if used_ml else _MODEL_LABEL_PHYS
+    })
 
 
-@router.get("/health")
-async def health():
-    """Health check"""
+# /api/predict/health et /models: mêmes corps pour chaque requête tant que le modèle ne change pas
+_PREDICT_HEALTH_BYTES = b""
+_MODELS_BYTES = b""
+
+
+@on_model_change
+def _refresh_predict_payloads() -> None:
+    """Encode l'état du modèle et la liste des véhicules servis par le router"""
+    global _PREDICT_HEALTH_BYTES, _MODELS_BYTES
     model = get_model()
-    return {
+    _PREDICT_HEALTH_BYTES = dumps({
         "status": "healthy",
         "ml_model_loaded": model is not None,
         "model_type": type(model).__name__ if model else "None"
-    }
+    })
+    _MODELS_BYTES = dumps({
+        "available_vehicles": AVAILABLE_VEHICLES,
+        "vehicle_specs": VEHICLE_INFO,
+        "model_info": get_model_info()
+    })
+
+
+@router.get("/health")
+async def health():
+    """Health check"""
+    return Response(content=_PREDICT_HEALTH_BYTES, media_type="application/json")
 
 
 @router.get("/models")
 async def get_models_info():
     """Info sur les modèles"""
-    model = get_model()
-    
-    model_info = {
-        "ml_model_loaded": model is not None,
-        "model_type": type(model).__name__ if model else None,
-    }
-    
-    if model is not None:
-        if hasattr(model, 'n_features_in_'):
-            model_info["n_features"] = int(model.n_features_in_)
-        if hasattr(model, 'feature_names_in_'):
-            model_info["feature_names"] = list(model.feature_names_in_)[:10]
-    
-    return {
-        "available_vehicles": ["BEV1", "BEV2"],
-        "vehicle_specs": {
-            "BEV1": {"name": "Tesla Model Y SR", "battery": "60.5 kWh", "chemistry": "LFP"},
-            "BEV2": {"name": "Tesla Model Y LR", "battery": "78.8 kWh", "chemistry": "NCA"},
-        },
-        "model_info": model_info
-    }
\ No newline at end of file
+    return Response(content=_MODELS_BYTES, media_type="application/json")
@@ -0,0 +1,26 @@
+"""
+Configuration Gunicorn - Plusieurs workers Uvicorn partageant le modèle ML
+
+Lancement (depuis backend/): gunicorn -c gunicorn.conf.py app.main:app
+
+Le modèle est chargé une seule fois dans le processus maître avant le fork:
+les workers héritent du booster en copy-on-write au lieu de le recharger chacun.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+timeout = 120
+
+# Importe l'application (et app.models.ml_model, qui fixe OMP_NUM_THREADS=1) dans le maître
+preload_app = True
+
+
+def on_starting(server):
+    """Charge le modèle dans le maître, avant la création des workers"""
+    from app.models.ml_model import load_model
+
+    if load_model() is None:
+        server.log.warning("⚠️ Modèle ML non chargé avant le fork - chaque worker réessaiera")